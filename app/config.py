@@ -0,0 +1,34 @@
+"""
+Configuración de la aplicación.
+Carga el archivo .env una única vez y expone las variables de entorno
+en un mapeo de solo lectura, para no consultar el entorno en cada solicitud.
+"""
+
+import os
+from types import MappingProxyType
+from dotenv import load_dotenv
+
+# Cargar variables de entorno (una sola vez, al importar el módulo)
+load_dotenv()
+
+# Variables reconocidas y sus valores por defecto
+_DEFAULTS = {
+    "WHATSAPP_TOKEN": None,
+    "WHATSAPP_VERIFY_TOKEN": None,
+    "WHATSAPP_APP_SECRET": None,
+    "PHONE_NUMBER_ID": None,
+    "OPENAI_API_KEY": None,
+    "OPENAI_ASSISTANT_ID": None,
+    "APP_ENV": "development",
+    "APP_VERSION": "1.0.0",
+    "PORT": "3000",
+    "DEBUG": "False",
+    "LOG_LEVEL": "INFO",
+    "MESSAGE_WORKERS": "32",
+    "MAX_PENDING_MESSAGES": "256",
+    "WORKERS": "4",
+    "RATE_LIMIT_MAX_IPS": "16384",
+    "REDIS_URL": None,
+}
+
+CONFIG = MappingProxyType({key: os.getenv(key, default) for key, default in _DEFAULTS.items()})
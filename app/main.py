@@ -1,33 +1,41 @@
-from flask import Flask, request, jsonify
-import os
-from dotenv import load_dotenv
-from app.whatsapp.handlers import handle_webhook, verify_webhook
+from flask import Flask
+from app.config import CONFIG
 from app.utils.logger import setup_logger
+from app.utils.security import MAX_WEBHOOK_BODY, start_rate_limit_sweeper
+from app.views import main, admin
 
-# Cargar variables de entorno
-load_dotenv()
-
-# Configurar logger
-logger = setup_logger()
-
-app = Flask(__name__)
-
-@app.route("/webhook", methods=["GET", "POST"])
-def webhook():
-    if request.method == "GET":
-        return verify_webhook(request)
+def create_app(config_name="development"):
+    """
+    Crea y configura la aplicación Flask.
     
-    elif request.method == "POST":
-        return handle_webhook(request)
-
-@app.route("/health", methods=["GET"])
-def health_check():
-    return jsonify({"status": "ok"})
+    Args:
+        config_name (str): Entorno de ejecución (development, production, testing)
+        
+    Returns:
+        Flask: Aplicación configurada
+    """
+    # Configurar logger
+    setup_logger()
+    
+    app = Flask(__name__)
+    app.config["APP_ENV"] = config_name
+    app.config["TESTING"] = config_name == "testing"
+    app.config["MAX_CONTENT_LENGTH"] = MAX_WEBHOOK_BODY
+    
+    # Registrar blueprints
+    app.register_blueprint(main)
+    app.register_blueprint(admin)
+    
+    # Limpieza periódica del rate limiting fuera del camino de cada solicitud
+    start_rate_limit_sweeper()
+    
+    return app
 
 def start_app():
-    port = int(os.getenv("PORT", 3000))
-    debug = os.getenv("DEBUG", "False").lower() in ("true", "1", "t")
+    port = int(CONFIG["PORT"])
+    debug = CONFIG["DEBUG"].lower() in ("true", "1", "t")
+    app = create_app(CONFIG["APP_ENV"])
     app.run(host="0.0.0.0", port=port, debug=debug)
 
 if __name__ == "__main__":
-    start_app()
\ No newline at end of file
+    start_app()
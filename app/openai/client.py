@@ -1,14 +1,42 @@
-import os
+import threading
+import time
 import openai
+from app.config import CONFIG
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Tiempo máximo (en segundos) que se espera la respuesta del asistente
+RUN_TIMEOUT = 60
+
+# Respuestas cuando el asistente no puede contestar
+RUN_FAILED_MESSAGE = "Lo siento, tuve un problema al procesar tu mensaje."
+NO_RESPONSE_MESSAGE = "No pude generar una respuesta."
+ASSISTANT_ERROR_MESSAGE = "Lo siento, ocurrió un error al procesar tu mensaje."
+FALLBACK_MESSAGES = (RUN_FAILED_MESSAGE, NO_RESPONSE_MESSAGE, ASSISTANT_ERROR_MESSAGE)
+
 class OpenAIClient:
+    __slots__ = ("api_key", "assistant_id", "_client", "_client_lock")
+    
     def __init__(self):
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        self.assistant_id = os.getenv("OPENAI_ASSISTANT_ID")
-        openai.api_key = self.api_key
+        self.api_key = CONFIG["OPENAI_API_KEY"]
+        self.assistant_id = CONFIG["OPENAI_ASSISTANT_ID"]
+        self._client = None
+        self._client_lock = threading.Lock()
+    
+    def _get_client(self):
+        """
+        Devuelve el cliente de OpenAI, creándolo una sola vez.
+        Reutilizar el cliente mantiene su pool de conexiones HTTP entre solicitudes.
+        
+        Returns:
+            openai.OpenAI: Cliente compartido
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = openai.OpenAI(api_key=self.api_key)
+        return self._client
         
     def get_assistant_response(self, query):
         """
@@ -21,7 +49,7 @@ class OpenAIClient:
             str: Respuesta generada por el asistente
         """
         try:
-            client = openai.OpenAI(api_key=self.api_key)
+            client = self._get_client()
             
             # Crear un thread para la conversación
             thread = client.beta.threads.create()
@@ -33,35 +61,36 @@ class OpenAIClient:
                 content=query
             )
             
-            # Ejecutar el asistente en el thread
-            run = client.beta.threads.runs.create(
-                thread_id=thread.id,
-                assistant_id=self.assistant_id
-            )
-            
-            # Esperar a que termine la ejecución
-            while run.status != "completed":
-                run = client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-                
-                if run.status == "failed":
-                    logger.error(f"Error en la ejecución del asistente: {run.error}")
-                    return "Lo siento, tuve un problema al procesar tu mensaje."
+            # Ejecutar el asistente en modo streaming: el texto llega en los
+            # eventos del run, sin sondear su estado ni listar los mensajes
+            deadline = time.monotonic() + RUN_TIMEOUT
+            chunks = []
             
-            # Obtener la respuesta
-            messages = client.beta.threads.messages.list(
-                thread_id=thread.id
-            )
-            
-            # La respuesta más reciente del asistente estará al inicio de la lista
-            for message in messages.data:
-                if message.role == "assistant":
-                    return message.content[0].text.value
+            with client.beta.threads.runs.stream(
+                thread_id=thread.id,
+                assistant_id=self.assistant_id,
+                timeout=RUN_TIMEOUT
+            ) as stream:
+                for event in stream:
+                    if event.event == "thread.message.delta":
+                        for content in event.data.delta.content or []:
+                            if content.type == "text" and content.text and content.text.value:
+                                chunks.append(content.text.value)
+                    
+                    elif event.event in ("thread.message.completed", "thread.run.completed"):
+                        if chunks:
+                            return "".join(chunks)
+                    
+                    elif event.event == "thread.run.failed":
+                        logger.error("Error en la ejecución del asistente: %s", event.data.last_error)
+                        return RUN_FAILED_MESSAGE
+                    
+                    if time.monotonic() > deadline:
+                        logger.error("Tiempo de espera agotado para la respuesta del asistente")
+                        return RUN_FAILED_MESSAGE
             
-            return "No pude generar una respuesta."
+            return NO_RESPONSE_MESSAGE
             
         except Exception as e:
-            logger.error(f"Error al obtener respuesta de OpenAI: {str(e)}")
-            return "Lo siento, ocurrió un error al procesar tu mensaje."
\ No newline at end of file
+            logger.error("Error al obtener respuesta de OpenAI: %s", e)
+            return ASSISTANT_ERROR_MESSAGE
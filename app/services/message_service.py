@@ -1,13 +1,25 @@
 from app.whatsapp.client import WhatsAppClient
-from app.openai.client import OpenAIClient
+from app.openai.client import OpenAIClient, FALLBACK_MESSAGES
+from app.utils.cache import TTLCache
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Mensaje genérico cuando falla el procesamiento (no es una respuesta del asistente,
+# por eso no pasa por la caché de respuestas)
+PROCESSING_ERROR_MESSAGE = "Lo siento, ocurrió un error al procesar tu mensaje. Por favor, intenta nuevamente más tarde."
+
+# Respuesta cuando el mensaje no contiene texto (stickers, imágenes, audio, etc.)
+PROMPT_FOR_INPUT = "No recibí ningún texto. ¿En qué puedo ayudarte?"
+
 # Instancias de los clientes
 whatsapp_client = WhatsAppClient()
 openai_client = OpenAIClient()
 
+# Respuestas recientes por (número, texto): si WhatsApp reenvía el mismo
+# mensaje no se vuelve a consultar al asistente
+response_cache = TTLCache(maxsize=1024, ttl=30)
+
 def process_incoming_message(from_number, message_text):
     """
     Procesa un mensaje entrante y envía una respuesta.
@@ -16,20 +28,29 @@ def process_incoming_message(from_number, message_text):
         from_number (str): Número de teléfono del remitente
         message_text (str): Texto del mensaje recibido
     """
-    logger.info(f"Procesando mensaje de {from_number}: {message_text}")
+    # Los mensajes sin texto no se envían al asistente
+    if not message_text or not message_text.strip():
+        whatsapp_client.send_message(from_number, PROMPT_FOR_INPUT)
+        return
+    
+    logger.info("Procesando mensaje de %s: %s", from_number, message_text)
     
     try:
-        # Obtener respuesta del asistente de OpenAI
-        ai_response = openai_client.get_assistant_response(message_text)
+        # Obtener respuesta del asistente de OpenAI (o la reciente en caché)
+        cache_key = (from_number, message_text)
+        ai_response = response_cache.get(cache_key)
+        if ai_response is None:
+            ai_response = openai_client.get_assistant_response(message_text)
+            if ai_response not in FALLBACK_MESSAGES:
+                response_cache.set(cache_key, ai_response)
         
         # Enviar respuesta por WhatsApp
         whatsapp_client.send_message(from_number, ai_response)
         
-        logger.info(f"Respuesta enviada a {from_number}")
+        logger.info("Respuesta enviada a %s", from_number)
         
     except Exception as e:
-        logger.error(f"Error al procesar mensaje: {str(e)}")
+        logger.error("Error al procesar mensaje: %s", e)
         
         # Enviar mensaje de error genérico
-        error_message = "Lo siento, ocurrió un error al procesar tu mensaje. Por favor, intenta nuevamente más tarde."
-        whatsapp_client.send_message(from_number, error_message)
\ No newline at end of file
+        whatsapp_client.send_message(from_number, PROCESSING_ERROR_MESSAGE)
\ No newline at end of file
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    Caché en memoria con capacidad máxima y expiración por entrada.
+    Al superar la capacidad se descarta la entrada usada hace más tiempo.
+    Es segura para usarse desde varios hilos.
+    """
+    
+    def __init__(self, maxsize, ttl):
+        """
+        Args:
+            maxsize (int): Número máximo de entradas
+            ttl (float): Segundos que permanece válida cada entrada
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        """
+        Obtiene el valor guardado para una clave si no ha expirado.
+        
+        Args:
+            key: Clave a buscar
+            default: Valor a devolver si la clave no existe o expiró
+            
+        Returns:
+            Valor guardado o default
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value):
+        """
+        Guarda un valor, descartando las entradas más antiguas si se excede la capacidad.
+        
+        Args:
+            key: Clave
+            value: Valor a guardar
+        """
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
@@ -1,12 +1,16 @@
+import atexit
 import logging
 import os
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+from app.config import CONFIG
 
 # Configuración global
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVEL = CONFIG["LOG_LEVEL"]
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 LOG_DIR = "logs"
+_FORMATTER = logging.Formatter(LOG_FORMAT)
 
 def setup_logger():
     """
@@ -15,6 +19,10 @@ def setup_logger():
     Returns:
         logging.Logger: Logger configurado
     """
+    # Configurar una sola vez aunque se llame varias veces (p. ej. una app por worker)
+    if getattr(setup_logger, "_done", False):
+        return logging.getLogger()
+    
     # Crear directorio de logs si no existe
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
@@ -27,20 +35,30 @@ def setup_logger():
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
     
+    # No registrar datos de hilo/proceso que el formato no utiliza
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.raiseExceptions = False
+    
     # Handler para consola
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
-    logger.addHandler(console_handler)
-    
-    # Handler para archivo con rotación
-    file_handler = RotatingFileHandler(
-        os.path.join(LOG_DIR, "whatsapp_bot.log"),
-        maxBytes=10485760,  # 10MB
-        backupCount=5
-    )
-    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
-    logger.addHandler(file_handler)
+    console_handler.setFormatter(_FORMATTER)
+    
+    # Handler para archivo; la rotación la hace logrotate y el handler
+    # reabre el archivo cuando detecta que fue reemplazado
+    file_handler = WatchedFileHandler(os.path.join(LOG_DIR, "whatsapp_bot.log"))
+    file_handler.setFormatter(_FORMATTER)
+    
+    # Los handlers de consola y archivo escriben desde un hilo propio;
+    # en el hilo de la solicitud cada registro solo se encola
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, console_handler, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    logger.addHandler(QueueHandler(log_queue))
     
+    setup_logger._done = True
     return logger
 
 def get_logger(name=None):
@@ -1,13 +1,68 @@
 import hashlib
 import hmac
-import os
 import base64
+import phonenumbers
+import re
+import socket
+import threading
 import time
+from collections import OrderedDict
+from functools import lru_cache
 from flask import request
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.config import CONFIG
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Tamaño máximo aceptado para el cuerpo del webhook (los de WhatsApp son mucho menores)
+MAX_WEBHOOK_BODY = 128 * 1024
+
+# Tamaño de los bloques en que se lee y se firma el cuerpo del webhook
+_READ_CHUNK_SIZE = 16 * 1024
+
+# Clave HMAC en bytes, calculada una sola vez (el secreto no cambia en ejecución)
+_APP_SECRET = CONFIG["WHATSAPP_APP_SECRET"].encode() if CONFIG["WHATSAPP_APP_SECRET"] else None
+
+# HMAC con la clave ya procesada; cada verificación trabaja sobre una copia
+_HMAC_TEMPLATE = hmac.new(_APP_SECRET, digestmod=hashlib.sha256) if _APP_SECRET else None
+
+# Firmas ya verificadas (firma -> cuerpo), para no recalcular el HMAC cuando
+# WhatsApp reintenta una entrega idéntica. Se guarda el cuerpo y no solo el
+# resultado: la firma llega en un header que controla el cliente, y sin comparar
+# el cuerpo bastaría reenviar una firma válida junto con otro contenido.
+# Guardar un SHA-256 del cuerpo costaría lo mismo que el propio HMAC, así que la
+# memoria se acota con pocas entradas y solo cuerpos pequeños (como máximo
+# SIGNATURE_CACHE_SIZE * SIGNATURE_CACHE_MAX_BODY = 512 KB por proceso)
+SIGNATURE_CACHE_SIZE = 64
+SIGNATURE_CACHE_MAX_BODY = 8 * 1024
+_signature_cache = OrderedDict()
+_signature_cache_lock = threading.Lock()
+
+# Estado del rate limiting por IP: (tokens disponibles, momento de la última recarga).
+# Repartido en shards con su propio lock para que solicitudes concurrentes no se
+# bloqueen entre sí; cada shard tiene capacidad fija y descarta la IP usada hace más tiempo
+RATE_LIMIT_MAX_IPS = int(CONFIG["RATE_LIMIT_MAX_IPS"])
+_SHARD_COUNT = 64
+_SHARD_MAX_IPS = max(1, RATE_LIMIT_MAX_IPS // _SHARD_COUNT)
+_shards = [(OrderedDict(), threading.Lock()) for _ in range(_SHARD_COUNT)]
+
+# Ventana por defecto del rate limiting; pasada una ventana sin solicitudes el
+# bucket de una IP vuelve a estar lleno y el barrido en segundo plano lo descarta
+RATE_LIMIT_WINDOW = 3600
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+# Con REDIS_URL configurado, el rate limiting se comparte entre workers en Redis
+_redis = None
+if CONFIG["REDIS_URL"]:
+    import redis
+    _redis = redis.Redis.from_url(
+        CONFIG["REDIS_URL"],
+        socket_timeout=0.5,
+        socket_connect_timeout=0.5
+    )
+
 def verify_whatsapp_signature(request):
     """
     Verifica la firma de las solicitudes entrantes de WhatsApp.
@@ -19,9 +74,7 @@ def verify_whatsapp_signature(request):
         bool: True si la firma es válida, False en caso contrario
     """
     # El token de App Secret debe estar en las variables de entorno
-    app_secret = os.getenv("WHATSAPP_APP_SECRET")
-    
-    if not app_secret:
+    if _HMAC_TEMPLATE is None:
         logger.warning("No se ha configurado WHATSAPP_APP_SECRET")
         return True  # Permitir en desarrollo si no hay secreto configurado
     
@@ -37,24 +90,116 @@ def verify_whatsapp_signature(request):
         logger.warning("Formato de firma inválido")
         return False
     
-    # Extraer el valor del hash
-    received_hash = signature.split("sha256=")[1]
+    # Extraer el valor del hash (lo que sigue al prefijo "sha256=")
+    try:
+        received_digest = bytes.fromhex(signature[7:])
+    except ValueError:
+        logger.warning("Formato de firma inválido")
+        return False
+    
+    # Rechazar cuerpos demasiado grandes antes de leerlos y calcular el hash
+    if (request.content_length or 0) > MAX_WEBHOOK_BODY:
+        logger.warning("Cuerpo del webhook demasiado grande: %s bytes", request.content_length)
+        return False
+    
+    with _signature_cache_lock:
+        cached_body = _signature_cache.get(received_digest)
     
     # Calcular el hash esperado
-    body = request.get_data()
-    expected_hash = hmac.new(
-        app_secret.encode(),
-        msg=body,
-        digestmod=hashlib.sha256
-    ).hexdigest()
+    mac = _HMAC_TEMPLATE.copy()
+    if cached_body is None:
+        body = _read_signed_body(request, mac)
+    else:
+        # Reintento de una entrega ya verificada: mismo cuerpo con la misma firma
+        try:
+            body = request.get_data(cache=True)
+        except RequestEntityTooLarge:
+            body = None
+        if body is not None and body == cached_body:
+            with _signature_cache_lock:
+                if received_digest in _signature_cache:
+                    _signature_cache.move_to_end(received_digest)
+            return True
+        if body is not None:
+            mac.update(body)
+    
+    # Sin Content-Length (chunked) el tamaño solo se conoce al leer el cuerpo
+    if body is None:
+        logger.warning("Cuerpo del webhook demasiado grande")
+        return False
     
     # Comparar hashes (usando comparación de tiempo constante)
-    return hmac.compare_digest(received_hash, expected_hash)
+    if not hmac.compare_digest(received_digest, mac.digest()):
+        return False
+    
+    # Solo se recuerdan las firmas válidas de cuerpos pequeños
+    if len(body) > SIGNATURE_CACHE_MAX_BODY:
+        return True
+    
+    with _signature_cache_lock:
+        _signature_cache[received_digest] = body
+        _signature_cache.move_to_end(received_digest)
+        if len(_signature_cache) > SIGNATURE_CACHE_SIZE:
+            _signature_cache.popitem(last=False)
+    
+    return True
+
+def _read_signed_body(request, mac):
+    """
+    Lee el cuerpo de la solicitud por bloques, actualizando el HMAC a medida
+    que llegan, y lo deja cacheado para que get_data() no vuelva a leerlo.
+    
+    Args:
+        request: Objeto de solicitud Flask
+        mac: HMAC a actualizar con el cuerpo
+        
+    Returns:
+        bytes: Cuerpo completo de la solicitud, o None si supera MAX_WEBHOOK_BODY
+    """
+    stream = request.stream
+    parts = []
+    size = 0
+    while True:
+        try:
+            chunk = stream.read(_READ_CHUNK_SIZE)
+        except RequestEntityTooLarge:
+            return None
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > MAX_WEBHOOK_BODY:
+            return None
+        mac.update(chunk)
+        parts.append(chunk)
+    
+    body = b"".join(parts)
+    request._cached_data = body
+    return body
+
+def _ip_key(ip_address):
+    """
+    Convierte una IP en la clave compacta que usa el rate limiting en memoria:
+    4 bytes para IPv4 y 16 para IPv6.
+    
+    Args:
+        ip_address (str): Dirección IP
+        
+    Returns:
+        bytes: IP empaquetada, o la cadena original si no es una IP válida
+    """
+    try:
+        family = socket.AF_INET6 if ":" in ip_address else socket.AF_INET
+        return socket.inet_pton(family, ip_address)
+    except (OSError, TypeError):
+        return ip_address
 
-def rate_limit_check(ip_address, limit=100, window=3600):
+def rate_limit_check(ip_address, limit=100, window=RATE_LIMIT_WINDOW):
     """
-    Implementación simple de rate limiting basada en IP.
-    En producción, usar Redis u otra solución de caché distribuida.
+    Rate limiting por IP con token bucket.
+    Cada IP dispone de hasta `limit` solicitudes, que se recargan de forma
+    continua a razón de `limit` por cada `window` segundos.
+    Si REDIS_URL está configurado se usa un contador compartido en Redis;
+    si Redis no responde se recurre a la implementación en memoria.
     
     Args:
         ip_address (str): Dirección IP para verificar
@@ -64,37 +209,126 @@ def rate_limit_check(ip_address, limit=100, window=3600):
     Returns:
         bool: True si está dentro del límite, False si excede
     """
-    # Nota: Esta es una implementación en memoria simple
-    # En producción, deberías usar Redis u otra solución de caché distribuida
+    if _redis is not None:
+        try:
+            return _redis_rate_limit_check(ip_address, limit, window)
+        except redis.RedisError as e:
+            logger.error("Error en Redis, se usa el rate limiting en memoria: %s", e)
     
-    # Simula un almacenamiento temporal (usar un diccionario real en la clase)
-    if not hasattr(rate_limit_check, "store"):
-        rate_limit_check.store = {}
+    key = _ip_key(ip_address)
+    buckets, lock = _shards[hash(key) % _SHARD_COUNT]
     
-    current_time = int(time.time())
+    with lock:
+        now = time.monotonic()
+        
+        # Recargar los tokens acumulados desde la última solicitud
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= _SHARD_MAX_IPS:
+                buckets.popitem(last=False)
+            tokens, last_refill = limit, now
+        else:
+            buckets.move_to_end(key)
+            tokens, last_refill = bucket
+        tokens = min(limit, tokens + (now - last_refill) * (limit / window))
+        
+        allowed = tokens >= 1
+        buckets[key] = (tokens - 1 if allowed else tokens, now)
     
-    # Limpiar registros antiguos
-    for ip in list(rate_limit_check.store.keys()):
-        if rate_limit_check.store[ip]["timestamp"] < current_time - window:
-            del rate_limit_check.store[ip]
+    if not allowed:
+        logger.warning("Rate limit excedido para IP: %s", ip_address)
     
-    # Verificar o inicializar el contador para esta IP
-    if ip_address not in rate_limit_check.store:
-        rate_limit_check.store[ip_address] = {
-            "count": 1,
-            "timestamp": current_time
-        }
-        return True
+    return allowed
+
+def sweep_rate_limits(window=RATE_LIMIT_WINDOW):
+    """
+    Descarta los buckets de las IPs sin solicitudes durante toda una ventana,
+    que ya se han recargado por completo. Recorre los shards de uno en uno
+    para no bloquear más de un shard a la vez.
     
-    # Actualizar y verificar el contador
-    rate_limit_check.store[ip_address]["count"] += 1
+    Args:
+        window (int): Ventana de tiempo en segundos
+        
+    Returns:
+        int: Número de IPs descartadas
+    """
+    cutoff = time.monotonic() - window
+    removed = 0
+    
+    for buckets, lock in _shards:
+        with lock:
+            # Los buckets están ordenados del uso más antiguo al más reciente
+            while buckets:
+                _, (_, last_refill) = next(iter(buckets.items()))
+                if last_refill >= cutoff:
+                    break
+                buckets.popitem(last=False)
+                removed += 1
+    
+    return removed
+
+def start_rate_limit_sweeper(window=RATE_LIMIT_WINDOW):
+    """
+    Inicia (una sola vez por proceso) el hilo que barre periódicamente,
+    cada cuarto de ventana, los buckets inactivos del rate limiting.
+    
+    Args:
+        window (int): Ventana de tiempo en segundos
+    """
+    global _sweeper
     
-    if rate_limit_check.store[ip_address]["count"] > limit:
-        logger.warning(f"Rate limit excedido para IP: {ip_address}")
+    def run():
+        while True:
+            time.sleep(window / 4)
+            removed = sweep_rate_limits(window)
+            if removed:
+                logger.debug("Rate limiting: %s IPs inactivas descartadas", removed)
+    
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=run, name="rate-limit-sweeper", daemon=True)
+            _sweeper.start()
+
+def _redis_rate_limit_check(ip_address, limit, window):
+    """
+    Rate limiting por IP con ventana fija en Redis (INCR + EXPIRE en un pipeline).
+    
+    Args:
+        ip_address (str): Dirección IP para verificar
+        limit (int): Número máximo de solicitudes en la ventana de tiempo
+        window (int): Ventana de tiempo en segundos
+        
+    Returns:
+        bool: True si está dentro del límite, False si excede
+    """
+    key = f"rl:{ip_address}:{int(time.time()) // window}"
+    
+    pipe = _redis.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, window)
+    count, _ = pipe.execute()
+    
+    if count > limit:
+        logger.warning("Rate limit excedido para IP: %s", ip_address)
         return False
     
     return True
 
+# Tabla de reemplazo de caracteres problemáticos para sanitize_input
+_SANITIZE_TABLE = str.maketrans({
+    "<": "&lt;",
+    ">": "&gt;",
+    "&": "&amp;",
+    '"': "&quot;",
+    "'": "&#x27;",
+    "/": "&#x2F;",
+    "\\": "&#x5C;",
+    "`": "&#x60;"
+})
+
+# Algún carácter de _SANITIZE_TABLE; sin ninguno el texto se devuelve tal cual
+_DANGEROUS_RE = re.compile(r"[<>&\"'/\\`]")
+
 def sanitize_input(text):
     """
     Sanitiza el texto de entrada para prevenir inyecciones.
@@ -112,38 +346,35 @@ def sanitize_input(text):
     # Esta es una implementación básica, considerá usar una biblioteca 
     # especializada como bleach para casos más complejos
     
-    # Reemplazar caracteres problemáticos
-    replacements = {
-        "<": "&lt;",
-        ">": "&gt;",
-        "&": "&amp;",
-        '"': "&quot;",
-        "'": "&#x27;",
-        "/": "&#x2F;",
-        "\\": "&#x5C;",
-        "`": "&#x60;"
-    }
+    # Caso habitual: nada que reemplazar
+    if not _DANGEROUS_RE.search(text):
+        return text
     
-    for char, replacement in replacements.items():
-        text = text.replace(char, replacement)
-    
-    return text
+    # Reemplazar caracteres problemáticos en una sola pasada
+    return text.translate(_SANITIZE_TABLE)
 
+@lru_cache(maxsize=10_000)
 def is_valid_phone_number(phone_number):
     """
-    Verifica si un número de teléfono tiene un formato válido.
+    Verifica si un número de teléfono es válido según los metadatos de
+    numeración de libphonenumber (código de país, longitud y prefijos).
+    Los resultados se cachean: los mismos usuarios escriben una y otra vez.
     
     Args:
-        phone_number (str): Número de teléfono a verificar
+        phone_number (str): Número de teléfono a verificar, en formato
+            internacional con o sin +
         
     Returns:
-        bool: True si el formato es válido, False en caso contrario
+        bool: True si el número es válido, False en caso contrario
     """
     if not phone_number:
         return False
     
-    # Eliminar espacios, guiones y paréntesis
-    clean_number = ''.join(c for c in phone_number if c.isdigit())
+    # WhatsApp envía los números sin el + inicial
+    if not phone_number.startswith("+"):
+        phone_number = "+" + phone_number
     
-    # Verificar longitud (entre 10 y 15 dígitos para números internacionales)
-    return 10 <= len(clean_number) <= 15
\ No newline at end of file
+    try:
+        return phonenumbers.is_valid_number(phonenumbers.parse(phone_number, None))
+    except phonenumbers.NumberParseException:
+        return False
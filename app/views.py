@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-import os
+from app.config import CONFIG
 from app.whatsapp.handlers import handle_webhook, verify_webhook
 from app.utils.logger import get_logger
 
@@ -8,18 +8,19 @@ logger = get_logger(__name__)
 # Crear Blueprint para las vistas principales
 main = Blueprint('main', __name__)
 
-@main.route("/webhook", methods=["GET", "POST"])
-def webhook():
+@main.route("/webhook", methods=["GET"])
+def webhook_get():
     """
-    Endpoint principal para el webhook de WhatsApp.
-    GET: Verifica el webhook cuando WhatsApp lo solicita.
-    POST: Procesa mensajes entrantes de WhatsApp.
+    Verifica el webhook cuando WhatsApp lo solicita.
     """
-    if request.method == "GET":
-        return verify_webhook(request)
-    
-    elif request.method == "POST":
-        return handle_webhook(request)
+    return verify_webhook(request)
+
+@main.route("/webhook", methods=["POST"])
+def webhook_post():
+    """
+    Procesa mensajes entrantes de WhatsApp.
+    """
+    return handle_webhook(request)
 
 @main.route("/health", methods=["GET"])
 def health_check():
@@ -29,7 +30,7 @@ def health_check():
     """
     return jsonify({
         "status": "ok",
-        "version": os.getenv("APP_VERSION", "1.0.0")
+        "version": CONFIG["APP_VERSION"]
     })
 
 # Blueprint para admin (se puede expandir en el futuro)
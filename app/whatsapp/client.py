@@ -1,51 +1,324 @@
+import asyncio
+import httpx
+import orjson
 import requests
-import os
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.config import CONFIG
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Número máximo de envíos simultáneos en send_messages
+MAX_CONCURRENT_SENDS = 16
+
+# Tiempos máximos (en segundos) de conexión y de lectura por cada envío
+SEND_TIMEOUT = (3, 10)
+
+# Credenciales y endpoint de la API, resueltos una sola vez al importar
+_TOKEN = CONFIG["WHATSAPP_TOKEN"]
+_PHONE_NUMBER_ID = CONFIG["PHONE_NUMBER_ID"]
+
+# Detectar la falta de configuración al arrancar y no en el primer envío;
+# solo las pruebas (APP_ENV=testing) pueden funcionar sin credenciales
+if not _TOKEN or not _PHONE_NUMBER_ID:
+    if CONFIG["APP_ENV"] != "testing":
+        raise RuntimeError("Faltan WHATSAPP_TOKEN o PHONE_NUMBER_ID en la configuración")
+    logger.warning("No se han configurado WHATSAPP_TOKEN o PHONE_NUMBER_ID; los envíos fallarán")
+
+_URL = f"https://graph.facebook.com/v17.0/{_PHONE_NUMBER_ID}/messages"
+_HEADERS = {
+    "Authorization": f"Bearer {_TOKEN}",
+    "Content-Type": "application/json"
+}
+
+def _build_session():
+    """
+    Crea la sesión HTTP compartida por todos los clientes de WhatsApp.
+    Reutiliza las conexiones TCP/TLS entre envíos y reintenta los errores
+    transitorios del gateway.
+    
+    Returns:
+        requests.Session: Sesión configurada
+    """
+    session = requests.Session()
+    
+    # Conexiones suficientes para todos los hilos que envían a la vez
+    pool_size = max(int(CONFIG["MESSAGE_WORKERS"]), MAX_CONCURRENT_SENDS)
+    
+    # El POST no es idempotente: solo se reintenta cuando es seguro que el
+    # mensaje no llegó a procesarse (errores de conexión y 503). Un 502/504 o un
+    # timeout de lectura pueden llegar después de que Graph aceptara el mensaje.
+    # Retry-After se ignora para no retener el hilo un tiempo arbitrario
+    retries = Retry(
+        total=2,
+        read=0,
+        backoff_factor=0.2,
+        status_forcelist=[503],
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=False
+    )
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_size,
+        max_retries=retries
+    ))
+    return session
+
+_session = _build_session()
+
+# Cuerpo de un mensaje de texto con los campos fijos ya serializados;
+# los huecos se rellenan con el destino y el texto codificados en JSON
+_PAYLOAD_TEMPLATE = (
+    b'{"messaging_product":"whatsapp","recipient_type":"individual",'
+    b'"to":%b,"type":"text","text":{"body":%b}}'
+)
+
+class CircuitBreaker:
+    """
+    Circuit breaker para las llamadas a la API de WhatsApp.
+    Tras varios fallos consecutivos deja de intentar envíos durante un tiempo
+    (OPEN); pasado ese tiempo permite una única prueba (HALF_OPEN) que decide
+    si se vuelve a cerrar o se abre de nuevo. Si la prueba no informa su
+    resultado en reset_timeout segundos, se permite otra.
+    """
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """
+        Args:
+            failure_threshold (int): Fallos consecutivos que abren el circuito
+            reset_timeout (float): Segundos que el circuito permanece abierto
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.opened_at = 0.0
+        self.probe_started_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        """
+        Indica si se puede intentar una llamada.
+        
+        Returns:
+            bool: True si la llamada puede realizarse
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.probe_started_at = now
+                return True
+            
+            # La prueba anterior quedó sin resultado: probar de nuevo
+            if self.state == self.HALF_OPEN and now - self.probe_started_at >= self.reset_timeout:
+                self.probe_started_at = now
+                return True
+            
+            return False
+    
+    def record_success(self):
+        """Registra una llamada exitosa y cierra el circuito."""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failure_count = 0
+    
+    def record_failure(self):
+        """Registra un fallo y abre el circuito si corresponde."""
+        with self._lock:
+            self.failure_count += 1
+            if self.state == self.HALF_OPEN or self.failure_count >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
 class WhatsAppClient:
     def __init__(self):
-        self.token = os.getenv("WHATSAPP_TOKEN")
-        self.phone_number_id = os.getenv("PHONE_NUMBER_ID")
-        self.api_url = f"https://graph.facebook.com/v17.0/{self.phone_number_id}/messages"
-        self.headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
+        # Circuit breaker para no insistir mientras la API no responde
+        self.breaker = CircuitBreaker()
+        # Sesión compartida entre instancias (un solo pool de conexiones)
+        self.session = _session
 
-    def send_message(self, to, message_text):
+    def _build_payload(self, to, message_text):
+        """
+        Serializa el cuerpo de un mensaje de texto.
+        
+        Args:
+            to (str): Número de destino en formato internacional sin +
+            message_text (str): Texto del mensaje a enviar
+        
+        Returns:
+            bytes: Payload JSON para la API de WhatsApp
+        """
+        # Solo se serializan los dos campos variables
+        return _PAYLOAD_TEMPLATE % (orjson.dumps(to), orjson.dumps(message_text))
+
+    def send_message(self, to, message_text, parse_response=False):
         """
         Envía un mensaje de texto a un número de WhatsApp.
         
         Args:
             to (str): Número de destino en formato internacional sin +
             message_text (str): Texto del mensaje a enviar
+            parse_response (bool, optional): Decodificar el JSON de la respuesta
+                (p. ej. para obtener el ID del mensaje). Defaults to False.
         
         Returns:
-            dict: Respuesta de la API de WhatsApp
-        """
-        payload = {
-            "messaging_product": "whatsapp",
-            "recipient_type": "individual",
-            "to": to,
-            "type": "text",
-            "text": {
-                "body": message_text
-            }
-        }
+            dict: Respuesta de la API de WhatsApp, o {"ok": True, "status": ...}
+            si no se pidió decodificarla
+        """
+        # Un error al serializar es local y no debe contar en el circuit breaker
+        payload = self._build_payload(to, message_text)
+        
+        if not self.breaker.allow():
+            logger.warning("API de WhatsApp no disponible, no se envía el mensaje a %s", to)
+            return {"error": "Circuito abierto: API de WhatsApp no disponible"}
         
+        # Cualquier salida sin éxito (incluidas excepciones inesperadas) cuenta
+        # como fallo, para que el circuit breaker nunca quede sin resultado
+        succeeded = False
         try:
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload
+            response = self.session.post(
+                _URL,
+                headers=_HEADERS,
+                data=payload,
+                timeout=SEND_TIMEOUT
             )
             response.raise_for_status()
+            succeeded = True
             
-            logger.info(f"Mensaje enviado a {to}")
+            logger.info("Mensaje enviado a %s", to)
+            if not parse_response:
+                # La mayoría de los llamadores solo necesita saber si se envió
+                return {"ok": True, "status": response.status_code}
             return response.json()
         
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error al enviar mensaje: {str(e)}")
-            return {"error": str(e)}
\ No newline at end of file
+            # Solo los errores de red o del servidor indican que la API no está disponible
+            if e.response is not None and e.response.status_code < 500:
+                succeeded = True
+            
+            logger.error("Error al enviar mensaje: %s", e)
+            return {"error": str(e)}
+        
+        finally:
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def _async_client(self):
+        """
+        Crea un cliente HTTP/2 asíncrono; todos los envíos hechos con él
+        se multiplexan sobre la misma conexión TLS.
+        
+        Returns:
+            httpx.AsyncClient: Cliente configurado
+        """
+        connect_timeout, read_timeout = SEND_TIMEOUT
+        return httpx.AsyncClient(
+            http2=True,
+            headers=_HEADERS,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+        )
+
+    async def send_message_async(self, to, message_text, parse_response=False, *, client=None):
+        """
+        Envía un mensaje de texto sin bloquear el event loop.
+        
+        Args:
+            to (str): Número de destino en formato internacional sin +
+            message_text (str): Texto del mensaje a enviar
+            parse_response (bool, optional): Decodificar el JSON de la respuesta. Defaults to False.
+            client (httpx.AsyncClient, optional): Cliente a reutilizar (solo por nombre).
+                Defaults a uno nuevo.
+        
+        Returns:
+            dict: Respuesta de la API de WhatsApp, o {"ok": True, "status": ...}
+            si no se pidió decodificarla
+        """
+        if client is None:
+            async with self._async_client() as client:
+                return await self.send_message_async(to, message_text, parse_response, client=client)
+        
+        # Un error al serializar es local y no debe contar en el circuit breaker
+        payload = self._build_payload(to, message_text)
+        
+        if not self.breaker.allow():
+            logger.warning("API de WhatsApp no disponible, no se envía el mensaje a %s", to)
+            return {"error": "Circuito abierto: API de WhatsApp no disponible"}
+        
+        # Cualquier salida sin éxito (incluida la cancelación) cuenta como fallo
+        succeeded = False
+        try:
+            response = await client.post(
+                _URL,
+                content=payload
+            )
+            response.raise_for_status()
+            succeeded = True
+            
+            logger.info("Mensaje enviado a %s", to)
+            if not parse_response:
+                # La mayoría de los llamadores solo necesita saber si se envió
+                return {"ok": True, "status": response.status_code}
+            return response.json()
+        
+        except httpx.HTTPError as e:
+            # Solo los errores de red o del servidor indican que la API no está disponible
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                succeeded = True
+            
+            logger.error("Error al enviar mensaje: %s", e)
+            return {"error": str(e)}
+        
+        finally:
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    async def send_messages_async(self, messages, parse_response=False):
+        """
+        Envía varios mensajes de texto de forma concurrente sobre una sola
+        conexión HTTP/2, con a lo sumo MAX_CONCURRENT_SENDS envíos en curso.
+        
+        Args:
+            messages (list): Lista de tuplas (to, message_text)
+            parse_response (bool, optional): Decodificar el JSON de cada respuesta. Defaults to False.
+        
+        Returns:
+            list: Respuestas de la API de WhatsApp, en el mismo orden que los mensajes
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+        
+        async with self._async_client() as client:
+            async def send(to, message_text):
+                async with semaphore:
+                    return await self.send_message_async(to, message_text, parse_response, client=client)
+            
+            return await asyncio.gather(*(send(to, message_text) for to, message_text in messages))
+
+    def send_messages(self, messages, parse_response=False):
+        """
+        Envía varios mensajes de texto de forma concurrente.
+        
+        Args:
+            messages (list): Lista de tuplas (to, message_text)
+            parse_response (bool, optional): Decodificar el JSON de cada respuesta. Defaults to False.
+        
+        Returns:
+            list: Respuestas de la API de WhatsApp, en el mismo orden que los mensajes
+        """
+        if len(messages) <= 1:
+            return [self.send_message(to, message_text, parse_response) for to, message_text in messages]
+        
+        return asyncio.run(self.send_messages_async(messages, parse_response))
@@ -1,23 +1,79 @@
 from flask import jsonify, request
-import os
-import json
+import hmac
+import logging
+import orjson
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.config import CONFIG
 from app.services.message_service import process_incoming_message
 from app.utils.logger import get_logger
 from app.utils.security import verify_whatsapp_signature, rate_limit_check, sanitize_input, is_valid_phone_number
 
 logger = get_logger(__name__)
 
+# Pool de hilos para procesar mensajes sin bloquear la respuesta del webhook
+executor = ThreadPoolExecutor(
+    max_workers=int(CONFIG["MESSAGE_WORKERS"]),
+    thread_name_prefix="wa"
+)
+
+# Límite de mensajes en proceso o en espera; por encima se descartan
+pending_messages = threading.BoundedSemaphore(int(CONFIG["MAX_PENDING_MESSAGES"]))
+
+def submit_message(from_number, message_text):
+    """
+    Encola un mensaje para procesarlo en segundo plano.
+    
+    Args:
+        from_number (str): Número de teléfono del remitente
+        message_text (str): Texto del mensaje recibido
+        
+    Returns:
+        bool: True si se encoló, False si se descartó por exceso de carga
+    """
+    if not pending_messages.acquire(blocking=False):
+        logger.warning("Demasiados mensajes pendientes, se descarta el de %s", from_number)
+        return False
+    
+    try:
+        future = executor.submit(process_incoming_message, from_number, message_text)
+    except BaseException:
+        # Sin tarea encolada nadie liberaría el cupo (p. ej. executor ya cerrado)
+        pending_messages.release()
+        raise
+    future.add_done_callback(_on_message_done)
+    return True
+
+def _on_message_done(future):
+    """
+    Libera el cupo del mensaje procesado y registra el error si lo hubo
+    (en segundo plano, nadie más vería la excepción).
+    
+    Args:
+        future (Future): Resultado de process_incoming_message
+    """
+    pending_messages.release()
+    
+    if future.cancelled():
+        return
+    
+    error = future.exception()
+    if error is not None:
+        logger.error("Error al procesar mensaje en segundo plano: %s", error, exc_info=error)
+
 def verify_webhook(request):
     """
     Verifica el webhook cuando WhatsApp lo solicita.
     """
-    verify_token = os.getenv("WHATSAPP_VERIFY_TOKEN")
+    verify_token = CONFIG["WHATSAPP_VERIFY_TOKEN"]
     mode = request.args.get("hub.mode")
     token = request.args.get("hub.verify_token")
     challenge = request.args.get("hub.challenge")
 
     if mode and token:
-        if mode == "subscribe" and token == verify_token:
+        # Comparación de tiempo constante (en bytes, admite caracteres no ASCII)
+        token_matches = hmac.compare_digest(token.encode(), (verify_token or "").encode())
+        if mode == "subscribe" and token_matches:
             logger.info("Webhook verificado exitosamente")
             return challenge, 200
         else:
@@ -26,6 +82,42 @@ def verify_webhook(request):
     
     return "Bad Request", 400
 
+# Tipos de mensaje que no son contenido del usuario: se confirman sin responder
+# (responder a una reacción a un mensaje del bot generaría un bucle de mensajes)
+IGNORED_MESSAGE_TYPES = frozenset({"reaction", "system", "unsupported"})
+
+def extract_message(data):
+    """
+    Extrae el mensaje entrante de una notificación del webhook,
+    recorriendo el payload una sola vez.
+    
+    Args:
+        data (dict): Payload recibido de WhatsApp
+        
+    Returns:
+        tuple: (from_number, message_type, message_body), con el texto vacío si
+        el mensaje no tiene texto; None si la notificación no contiene un mensaje
+    """
+    try:
+        if not data.get("object"):
+            return None
+        message = data["entry"][0]["changes"][0]["value"]["messages"][0]
+        message_type = message.get("type", "text")
+        
+        # Las respuestas a botones y listas traen el texto elegido por el usuario
+        if message_type == "button":
+            body = message.get("button", {}).get("text", "")
+        elif message_type == "interactive":
+            interactive = message.get("interactive", {})
+            reply = interactive.get("button_reply") or interactive.get("list_reply") or {}
+            body = reply.get("title", "")
+        else:
+            body = message.get("text", {}).get("body", "")
+        
+        return message["from"], message_type, body
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return None
+
 def handle_webhook(request):
     """
     Maneja las notificaciones entrantes del webhook de WhatsApp.
@@ -39,41 +131,39 @@ def handle_webhook(request):
         # Control de rate limiting basado en IP
         client_ip = request.remote_addr
         if not rate_limit_check(client_ip):
-            logger.warning(f"Rate limit excedido para IP: {client_ip}")
+            logger.warning("Rate limit excedido para IP: %s", client_ip)
             return "Too Many Requests", 429
         
-        data = request.json
-        logger.debug(f"Webhook recibido: {json.dumps(data)}")
+        # Reutilizar el cuerpo ya leído (y cacheado) al verificar la firma
+        data = orjson.loads(request.get_data(cache=True))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Webhook recibido: %s", orjson.dumps(data).decode())
         
-        # Verificar si es un mensaje entrante y procesarlo
-        if (data.get("object")
-            and data.get("entry")
-            and data["entry"][0].get("changes")
-            and data["entry"][0]["changes"][0].get("value")
-            and data["entry"][0]["changes"][0]["value"].get("messages")
-            and data["entry"][0]["changes"][0]["value"]["messages"][0]):
-            
-            # Extraer información del mensaje
-            phone_number_id = data["entry"][0]["changes"][0]["value"]["metadata"]["phone_number_id"]
-            from_number = data["entry"][0]["changes"][0]["value"]["messages"][0]["from"]
-            
-            # Validar número de teléfono
-            if not is_valid_phone_number(from_number):
-                logger.warning(f"Número de teléfono inválido: {from_number}")
-                return "OK", 200  # Devolver OK para no revelar validación
-            
-            # Obtener y sanitizar el texto del mensaje
-            message_body = data["entry"][0]["changes"][0]["value"]["messages"][0]["text"]["body"]
-            sanitized_message = sanitize_input(message_body)
-            
-            # Procesar mensaje y enviar respuesta
-            process_incoming_message(from_number, sanitized_message)
-            
-            return "OK", 200
-        else:
+        # Verificar si es un mensaje entrante y extraer su información
+        parsed = extract_message(data)
+        if parsed is None:
             # Si no es un mensaje relevante, simplemente confirmar recepción
             return "OK", 200
+        
+        from_number, message_type, message_body = parsed
+        
+        # Reacciones y avisos del sistema no llevan respuesta
+        if message_type in IGNORED_MESSAGE_TYPES:
+            return "OK", 200
+        
+        # Validar número de teléfono
+        if not is_valid_phone_number(from_number):
+            logger.warning("Número de teléfono inválido: %s", from_number)
+            return "OK", 200  # Devolver OK para no revelar validación
+        
+        # Sanitizar el texto del mensaje
+        sanitized_message = sanitize_input(message_body)
+        
+        # Procesar mensaje y enviar respuesta en segundo plano
+        submit_message(from_number, sanitized_message)
+        
+        return "OK", 200
     
     except Exception as e:
-        logger.error(f"Error al procesar webhook: {str(e)}")
+        logger.error("Error al procesar webhook: %s", e)
         return "Internal Server Error", 500
\ No newline at end of file
@@ -0,0 +1,18 @@
+"""
+Configuración de Gunicorn para producción.
+Gunicorn carga este archivo automáticamente al ejecutar:
+
+    gunicorn run:app
+
+Los workers gevent aplican monkey-patching antes de cargar la aplicación,
+por lo que las llamadas bloqueantes (requests, OpenAI) ceden el control y
+cada worker atiende muchas solicitudes concurrentes.
+"""
+
+from app.config import CONFIG
+
+bind = f"0.0.0.0:{CONFIG['PORT']}"
+workers = int(CONFIG["WORKERS"])
+worker_class = "gevent"
+worker_connections = 1000
+keepalive = 30
@@ -3,19 +3,20 @@
 Punto de entrada principal para la aplicación WhatsApp Bot.
 Este archivo facilita la ejecución de la aplicación y puede
 ser usado directamente o por un servidor WSGI como Gunicorn.
+
+Ejecutar directamente solo inicia el servidor de desarrollo de Flask.
+En producción usar Gunicorn con workers gevent (ver gunicorn.conf.py):
+
+    gunicorn run:app
 """
 
-import os
-from dotenv import load_dotenv
+from app.config import CONFIG
 from app.main import create_app
 
-# Cargar variables de entorno
-load_dotenv()
-
 # Obtener configuración del entorno
-app_env = os.getenv("APP_ENV", "development")
-port = int(os.getenv("PORT", 3000))
-debug = os.getenv("DEBUG", "False").lower() in ("true", "1", "t")
+app_env = CONFIG["APP_ENV"]
+port = int(CONFIG["PORT"])
+debug = CONFIG["DEBUG"].lower() in ("true", "1", "t")
 
 # Crear aplicación
 app = create_app(app_env)